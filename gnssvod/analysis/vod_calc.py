@@ -12,12 +12,13 @@ import pandas as pd
 import xarray as xr
 import warnings
 from gnssvod.io.preprocess import get_filelist
+from gnssvod.funcs.parallel import imap
 import pdb
 #--------------------------------------------------------------------------
 #----------------- CALCULATING VOD -------------------
 #-------------------------------------------------------------------------- 
 
-def calc_vod(filepattern,pairings,bands):
+def calc_vod(filepattern,pairings,bands,n_jobs=1):
     """
     Combines a list of NetCDF files containing gathered GNSS receiver data, calculates VOD and returns that data.
     
@@ -38,6 +39,10 @@ def calc_vod(filepattern,pairings,bands):
     bands: dictionary
         Dictionary of column names to be used for combining different bands
         For example bands={'VOD_L1':['S1','S1X','S1C']}
+
+    n_jobs: int (optional)
+        Number of processes used to read the NetCDF files in parallel
+        If 1 (default), files are read sequentially. If -1, all available cores are used
         
     Returns
     -------
@@ -45,30 +50,135 @@ def calc_vod(filepattern,pairings,bands):
     
     """
     files = get_filelist({'':filepattern})
-    # read in all data
-    data = [xr.open_mfdataset(x).to_dataframe().dropna(how='all') for x in files['']]
-    # concatenate
-    data = pd.concat(data)
+    # read in and concatenate all data
+    # only the variables used for VOD are kept
+    keepvars = list(dict.fromkeys([x for y in bands.values() for x in y]+['Azimuth','Elevation']))
+    data = _read_files(files[''],n_jobs,keepvars)
     # calculate VOD based on pairings
     out = dict()
     for icase in pairings.items():
         iref = data.xs(icase[1][0],level='Station')
         igrn = data.xs(icase[1][1],level='Station')
-        idat = iref.merge(igrn,on=['Epoch','SV'],suffixes=['_ref','_grn'])
-        for ivod in bands.items():
+        idat = _merge_on_index(iref,igrn,suffixes=['_ref','_grn'])
+        # -log(10^((grn-ref)/10))*cos(90-ele) simplifies to (ref-grn)*ln(10)/10*sin(ele)
+        # the elevation term is the same for all variables and is only calculated once per pairing
+        ielename = f"Elevation_grn"
+        sin_ele = np.sin(np.deg2rad(idat[ielename].to_numpy()))*(np.log(10)/10)
+        # the output is preallocated with one column per band
+        vod = np.empty((len(idat),len(bands)))
+        for j,ivod in enumerate(bands.items()):
             ivars = np.intersect1d(data.columns.to_list(),ivod[1])
-            for ivar in ivars:
+            ivals = np.full((len(idat),max(len(ivars),1)),np.nan)
+            for i,ivar in enumerate(ivars):
                 irefname = f"{ivar}_ref"
                 igrnname = f"{ivar}_grn"
-                ielename = f"Elevation_grn"
-                idat[ivar] = -np.log(np.power(10,(idat[igrnname]-idat[irefname])/10)) \
-                            *np.cos(np.deg2rad(90-idat[ielename]))
-            
-            idat[ivod[0]] = np.nan
-            for ivar in ivars:
-                idat[ivod[0]] = idat[ivod[0]].fillna(idat[ivar])
+                ivals[:,i] = (idat[irefname].to_numpy()-idat[igrnname].to_numpy())*sin_ele
+            # the band takes the value of the first of its variables that is not NaN (in sorted order),
+            # the selected value is NaN only if all variables are NaN
+            first = np.argmax(~np.isnan(ivals),axis=1)
+            vod[:,j] = ivals[np.arange(len(ivals)),first]
 
-        idat = idat[list(bands.keys())+['Azimuth_ref','Elevation_ref']].rename(columns={'Azimuth_ref':'Azimuth','Elevation_ref':'Elevation'})
+        idat = pd.DataFrame(vod,index=idat.index,columns=list(bands.keys())).assign(
+               Azimuth=idat['Azimuth_ref'].to_numpy(),Elevation=idat['Elevation_ref'].to_numpy())
         # store result in dictionary
         out[icase[0]]=idat
-    return out
\ No newline at end of file
+    return out
+
+def _read_files(filenames,n_jobs=1,keepvars=None):
+    # reads all NetCDF files and concatenates their non-empty rows into a single dataframe
+    # each file is flattened to numpy arrays (in the same row order as Dataset.to_dataframe) and the final
+    # columns are only assembled at the end, one at a time, instead of concatenating per-file dataframes
+    pieces = list(imap(_read_file,[(x,keepvars) for x in filenames],n_jobs))
+    if len(pieces)==0:
+        raise ValueError("No files to concatenate")
+    dims = list(pieces[0][1].keys())
+    columns = list(dict.fromkeys([x for piece in pieces for x in piece[0].keys()]))
+    index = pd.MultiIndex.from_arrays([np.concatenate([piece[1].pop(x) for piece in pieces]) for x in dims],names=dims)
+    data = dict()
+    for col in columns:
+        dtype = np.result_type(*[piece[0][col].dtype for piece in pieces if col in piece[0]])
+        if not all([col in piece[0] for piece in pieces]):
+            # a column missing from some of the files is filled with NA
+            dtype = np.result_type(dtype,np.float64) if dtype.kind in 'biuf' else dtype
+        out = np.empty(sum([piece[2] for piece in pieces]),dtype=dtype)
+        offset = 0
+        for piece in pieces:
+            values = piece[0].pop(col,None)
+            out[offset:offset+piece[2]] = np.nan if values is None else values
+            offset += piece[2]
+        data[col] = out
+    return pd.DataFrame(data,index=index,copy=False)
+
+def _read_file(filename,keepvars=None):
+    # flattens the non-empty rows of one NetCDF file to a dictionary of columns and a dictionary of index levels
+    # only numpy arrays are returned, so that they are cheap to send back from a worker process
+    # if keepvars is given, the other variables are only used to find the empty rows and are not returned
+    # variables are read without masking and scaling, which is only applied to the non-empty rows
+    with xr.open_dataset(filename,mask_and_scale=False) as ds:
+        dims = list(ds.dims)
+        shape = [ds.sizes[x] for x in dims]
+        # same as dropna(how='all') on all variables, so that the rows do not depend on keepvars
+        allna = np.ones(int(np.prod(shape)),dtype=bool)
+        cols = dict()
+        isna = dict()
+        for x in ds.data_vars:
+            values = ds[x].variable.set_dims(dict(zip(dims,shape))).values.reshape(-1)
+            ixna = _isna_raw(values,ds[x].attrs)
+            allna &= ixna
+            if (keepvars is None) or (x in keepvars):
+                cols[x] = values
+                isna[x] = ixna
+        keep = np.flatnonzero(~allna)
+        cols = {x:_mask_and_scale(y[keep],isna[x][keep],ds[x].attrs) for x,y in cols.items()}
+        levels = {x:ds.get_index(x).values[y] for x,y in zip(dims,np.unravel_index(keep,shape))}
+    return cols,levels,len(keep)
+
+def _isna_raw(values,attrs):
+    # missing values of a variable that has not been masked yet
+    isna = pd.isna(values)
+    for x in ['_FillValue','missing_value']:
+        if x in attrs:
+            isna |= (values==attrs[x]) if np.ndim(attrs[x])==0 else np.isin(values,attrs[x])
+    return isna
+
+def _mask_and_scale(values,isna,attrs):
+    # decodes raw values the same way as xarray does when opening a file with mask_and_scale=True:
+    # missing values become NaN, then values are multiplied by scale_factor and add_offset is added
+    scale_factor = attrs.get('scale_factor')
+    add_offset = attrs.get('add_offset')
+    # other types (e.g. times or strings) are already decoded
+    if (values.dtype.kind not in 'iuf') or ((scale_factor is None) and (add_offset is None) and (not isna.any())):
+        return values
+    if values.dtype.kind=='f':
+        dtype = values.dtype
+    elif (scale_factor is not None) or (add_offset is not None):
+        # packed integers are unpacked to the float type of scale_factor and add_offset
+        dtype = np.result_type(*[np.asarray(x).dtype for x in [scale_factor,add_offset] if x is not None])
+        dtype = dtype if dtype.kind=='f' else np.dtype(np.float64)
+    else:
+        # small integers with missing values fit in float32
+        dtype = np.dtype(np.float32) if values.dtype.itemsize<=2 else np.dtype(np.float64)
+    out = values.astype(dtype)
+    out[isna] = np.nan
+    if scale_factor is not None:
+        out *= scale_factor
+    if add_offset is not None:
+        out += add_offset
+    return out
+
+def _merge_on_index(left,right,suffixes):
+    # inner merge of two dataframes on their (Epoch,SV) MultiIndex, keeping the order of the left dataframe
+    # each (Epoch,SV) pair is encoded as a single int64 key (epoch code * number of SVs + SV code),
+    # so that pandas hashes integers instead of tuples of Timestamps and strings
+    epochs = left.index.levels[0].union(right.index.levels[0])
+    svs = left.index.levels[1].union(right.index.levels[1])
+    def get_keys(df):
+        iepoch = epochs.get_indexer(df.index.levels[0])[df.index.codes[0]]
+        isv = svs.get_indexer(df.index.levels[1])[df.index.codes[1]]
+        return iepoch.astype(np.int64)*len(svs)+isv
+    out = left.reset_index(drop=True).assign(_key=get_keys(left)).merge(
+          right.reset_index(drop=True).assign(_key=get_keys(right)),on='_key',suffixes=suffixes)
+    # restore the (Epoch,SV) index from the keys
+    keys = out.pop('_key').to_numpy()
+    out.index = pd.MultiIndex(levels=[epochs,svs],codes=[keys//len(svs),keys%len(svs)],names=left.index.names)
+    return out
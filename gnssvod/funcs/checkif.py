@@ -54,6 +54,14 @@ def does_a_zip_exist(fileName):
     else:
         return False
 
+def _extract_download(downloadName, fileName):
+    # get_sp3 and get_clock already extract the downloaded archive, in which case
+    # the archive is only deleted instead of being decompressed a second time
+    if os.path.exists(fileName) and downloadName is not None and os.path.exists(downloadName):
+        os.remove(downloadName)
+    else:
+        decompress_on_disk(downloadName, delete=True)
+
 def isexist(fileName):
     if os.path.exists(fileName) == False:
         if not does_a_zip_exist(fileName):
@@ -96,10 +104,10 @@ def isexist(fileName):
                     decompress_on_disk(fileName + ".gz", delete=True)
             elif extension in {"clk","clk_05s"}:
                 downloadName = download.get_clock(fileName)
-                decompress_on_disk(downloadName, delete=True)
+                _extract_download(downloadName, fileName)
             elif extension == "sp3":
                 downloadName = download.get_sp3(fileName)
-                decompress_on_disk(downloadName, delete=True)
+                _extract_download(downloadName, fileName)
             elif extension[-1].lower() == "i":
                 download.get_ionosphere(fileName)
                 decompress_on_disk(fileName + ".gz", delete=True)
@@ -0,0 +1,43 @@
+# ===========================================================
+# ========================= imports =========================
+import os
+import collections
+from concurrent.futures import ProcessPoolExecutor
+# ===========================================================
+
+def imap(func, args, n_jobs=1):
+    """
+    Yields func(*arg) for each arg in args, in the same order as args
+
+    Parameters
+    ----------
+    func: function
+        The function to call. If n_jobs>1 it must be picklable (i.e. defined at module level)
+
+    args: list of tuples
+        The arguments of each call
+
+    n_jobs: int (optional)
+        Number of processes used to make the calls in parallel
+        If 1 (default), calls are made sequentially in the current process. If -1, all available cores are used
+        At most 2*n_jobs calls are pending at any time so that results do not pile up in memory
+
+    Returns
+    -------
+    Generator of the results of each call
+    """
+    args = list(args)
+    njobs = os.cpu_count() if n_jobs==-1 else n_jobs
+    njobs = max(1,min(njobs,len(args)))
+    if njobs==1:
+        for arg in args:
+            yield func(*arg)
+        return
+    with ProcessPoolExecutor(max_workers=njobs) as executor:
+        pending = collections.deque()
+        for arg in args:
+            pending.append(executor.submit(func,*arg))
+            if len(pending)>=2*njobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
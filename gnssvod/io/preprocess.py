@@ -14,13 +14,20 @@ import pandas as pd
 import xarray as xr
 import warnings
 import fnmatch
+import pickle
+import collections
+from concurrent.futures import ThreadPoolExecutor
 from gnssvod.io.readFile import read_obsFile
 from gnssvod.funcs.checkif import (isfloat, isint, isexist)
 from gnssvod.funcs.date import doy2date
 from gnssvod.position.interpolation import sp3_interp_fast
 from gnssvod.position.position import gnssDataframe
 from gnssvod.funcs.constants import _system_name
+from gnssvod.funcs.parallel import imap
 import pdb
+
+# suggested folder for caching interpolated orbits between runs (caching is off unless orbit_cachedir is given)
+ORBIT_CACHEDIR = os.path.join(os.path.expanduser('~'),'.cache','gnssvod')
 #-------------------------------------------------------------------------
 #----------------- FILE SELECTION AND BATCH PROCESSING -------------------
 #-------------------------------------------------------------------------
@@ -31,7 +38,9 @@ def preprocess(filepattern,
                outputdir=None,
                overwrite=False,
                compress=True,
-               outputresult=False):
+               outputresult=False,
+               n_jobs=1,
+               orbit_cachedir=None):
     """
     Returns lists of Observation objects containing GNSS observations read from RINEX observation files
     
@@ -44,6 +53,7 @@ def preprocess(filepattern,
     orbit: bool (optional) 
         if orbit=True, will download orbit solutions and calculate Azimuth and Elevation parameters
         if orbit=False, will not calculate additional gnss parameters
+        If orbit_cachedir is given, interpolated orbits are cached there so that they can be recycled in later runs
         
     interval: string or None (optional)
         if interval = None, the observations will be returned at the same rate as they were saved
@@ -64,6 +74,7 @@ def preprocess(filepattern,
     compress: bool (optional)
         If True, will save all SNR, Azimuth, and Elevation data as int16 with a scale factor to restore the first decimal
         Encoding for these variables will be {"dtype": "int16", "scale_factor": 0.1, "zlib": True, "_FillValue":-9999}
+        All variables are compressed with zlib (complevel=1) and the shuffle filter, in chunks of at least 64 kB
 
     overwrite: bool (optional)
         If False (default), RINEX files with an existing matching files in the 
@@ -71,6 +82,18 @@ def preprocess(filepattern,
 
     outputresult: bool (optional)
         If True, observation objects will also be returned as a dictionary
+
+    n_jobs: int (optional)
+        Number of processes used to read and resample RINEX files in parallel
+        If 1 (default), files are processed sequentially. If -1, all available cores are used
+        Orbits are always calculated and files are always saved by the main process
+
+    orbit_cachedir: string or None (optional)
+        Folder where interpolated orbits are cached between runs, one file per observation file span and interval
+        The parsed SP3 and clock files they are calculated from are cached in the same folder
+        If None (default), nothing is cached on disk. For example orbit_cachedir=gnssvod.io.preprocess.ORBIT_CACHEDIR
+        uses ~/.cache/gnssvod. Cached files are never deleted by gnssvod and the cache has no size limit,
+        delete the folder (or the .pkl files in it) to clear the cache
         
     Returns
     -------
@@ -80,6 +103,11 @@ def preprocess(filepattern,
     """
     # grab all files matching the patterns
     filelist = get_filelist(filepattern)
+
+    # the variables to keep do not depend on the file, 'epoch' and 'SYSTEM' are always 
+    # kept as they are required for calculating azimuth and elevation
+    if keepvars is not None:
+        keepvars = list(dict.fromkeys(list(keepvars)+['epoch','SYSTEM']))
     
     out = dict()
     for item in filelist.items():
@@ -90,80 +118,72 @@ def preprocess(filepattern,
         if (not overwrite) and (outputdir is not None):
             # gather all files that already exist in the outputdir
             files_to_skip = get_filelist({station_name:f"{outputdir[station_name]}*.nc"})
-            files_to_skip = [os.path.basename(x) for x in files_to_skip[station_name]]
+            files_to_skip = set([os.path.basename(x) for x in files_to_skip[station_name]])
         else:
-            files_to_skip = []
+            files_to_skip = set()
+
+        # determine the names of the output files that will be saved at the end of the loop
+        out_names = [os.path.splitext(os.path.basename(x))[0]+'.nc' for x in filelist]
+        # files whose saved output file already exists are removed from the list before processing
+        nskip = sum([x in files_to_skip for x in out_names])
+        if nskip>0:
+            print(f"{nskip} files already exist in {outputdir[station_name]}, skipping.. (pass overwrite=True to overwrite)")
+        tokeep = [(x,y) for x,y in zip(filelist,out_names) if y not in files_to_skip]
+        # nothing left to do for this station if all files were already processed
+        if len(tokeep)==0:
+            if outputresult:
+                out[station_name] = []
+            continue
         
-        # for each file
+        # files are read, subset and resampled (possibly in parallel) and come back in their original order
+        prepared = imap(_prepare_obs,[(x[0],keepvars,interval) for x in tokeep],n_jobs)
+        
+        # files are written to disk in a background thread while the next file is being processed
+        # (leaving the with block waits for any pending write, even if an error occurred)
         result = []
-        for i,filename in enumerate(filelist):
-            # determine the name of the output file that will be saved at the end of the loop
-            out_name = os.path.splitext(os.path.basename(filename))[0]+'.nc'
-            # if the name of the saved output file is in the files to skip, skip processing
-            if out_name in files_to_skip:
-                print(f"{out_name} already exists, skipping.. (pass overwrite=True to overwrite)")
-                continue # skip remainder of loop and go directly to next filename
-            
-            # read in the file
-            x = read_obsFile(filename)
-            print(f"Processing {len(x.observation):n} individual observations")
-
-            # only keep required vars
-            if keepvars is not None:
-                x.observation = subset_vars(x.observation,keepvars)
-                # update the observation_types list
-                x.observation_types = x.observation.columns.to_list()
-                
-            # resample if required
-            if interval is not None:
-                x = resample_obs(x,interval)
-                
-            # calculate Azimuth and Elevation if required
-            if orbit:
-                print(f"Calculating Azimuth and Elevation")
-                # note: orbit cannot be parallelized easily because it 
-                # downloads and unzips third-party files in the current directory
-                if not 'orbit_data' in locals():
-                    # if there is no previous orbit data, the orbit data is returned as well
-                    x, orbit_data = add_azi_ele(x)
-                else:
-                    # on following iterations the orbit data is tentatively recycled to reduce computational time
-                    x, orbit_data = add_azi_ele(x, orbit_data)
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            writes = collections.deque()
+            for i,((filename,out_name),x) in enumerate(zip(tokeep,prepared)):
+                # calculate Azimuth and Elevation if required
+                if orbit:
+                    print(f"Calculating Azimuth and Elevation")
+                    # note: orbit is not calculated in the worker processes because it downloads and unzips
+                    # third-party files in the current directory (sp3_interp_fast does this one file at a time)
+                    if not 'orbit_data' in locals():
+                        # if there is no previous orbit data, the orbit data is returned as well
+                        x, orbit_data = add_azi_ele(x, cachedir=orbit_cachedir)
+                    else:
+                        # on following iterations the orbit data is tentatively recycled to reduce computational time
+                        x, orbit_data = add_azi_ele(x, orbit_data, cachedir=orbit_cachedir)
             
-            # make sure we drop any duplicates
-            x.observation=x.observation[~x.observation.index.duplicated(keep='first')]
+                # make sure we drop any duplicates
+                x.observation = _dedup_sorted(x.observation)
             
-            # store result in memory
-            if outputresult:
-                result.append(x)
+                # store result in memory
+                if outputresult:
+                    result.append(x)
                 
-            # write to file if required
-            if outputdir is not None:
-                ioutputdir = outputdir[station_name]
-                # check that the output directory exists
-                if not os.path.exists(ioutputdir):
-                    os.makedirs(ioutputdir)
-                # delete file if it exists
-                out_path = os.path.join(ioutputdir,out_name)
-                if os.path.exists(out_path):
-                    os.remove(out_path)
-                # save as NetCDF
-                ds = x.observation.to_xarray()
-                ds.attrs['filename'] = x.filename
-                ds.attrs['observation_types'] = x.observation_types
-                ds.attrs['epoch'] = x.epoch.isoformat()
-                ds.attrs['approx_position'] = x.approx_position
-                if compress:
-                    enc = {"dtype": "int16", "scale_factor": 0.1, "zlib": True, "_FillValue":-9999}
-                    to_compress = [fnmatch.fnmatch(x,'S??') | 
-                                   fnmatch.fnmatch(x,'S?') | 
-                                   fnmatch.fnmatch(x,'Azimuth') | 
-                                   fnmatch.fnmatch(x,'Elevation') for x in list(ds.keys())]
-                    encodings = {x:enc for x in np.array(list(ds.keys()))[to_compress]}
-                    ds.to_netcdf(out_path,encoding=encodings)
-                else:
-                    ds.to_netcdf(out_path)
-                print(f"Saved {len(x.observation):n} individual observations in {out_name}")
+                # write to file if required
+                if outputdir is not None:
+                    ioutputdir = outputdir[station_name]
+                    # check that the output directory exists
+                    if not os.path.exists(ioutputdir):
+                        os.makedirs(ioutputdir)
+                    out_path = os.path.join(ioutputdir,out_name)
+                    # save as NetCDF (any existing file is overwritten)
+                    ds = _df_to_ds(x.observation)
+                    ds.attrs['filename'] = x.filename
+                    ds.attrs['observation_types'] = x.observation_types
+                    ds.attrs['epoch'] = x.epoch.isoformat()
+                    ds.attrs['approx_position'] = x.approx_position
+                    writes.append(writer.submit(_save_ds,ds,out_path,compress,len(x.observation)))
+                    # at most two files are waiting to be written, to limit memory usage
+                    if len(writes)>2:
+                        writes.popleft().result()
+
+            # wait until all files are written (this also raises any error that occurred while writing)
+            for write in writes:
+                write.result()
                 
         # store station in memory if required
         if outputresult:
@@ -174,69 +194,262 @@ def preprocess(filepattern,
     else:
         return
 
+def _prepare_obs(filename,keepvars,interval):
+    # reads in a RINEX file, only keeps required vars and resamples the observations if required
+    x = read_obsFile(filename)
+    print(f"Processing {len(x.observation):n} individual observations")
+
+    # only keep required vars
+    if keepvars is not None:
+        x.observation = subset_vars(x.observation,keepvars,force_epoch_system=False)
+        # update the observation_types list
+        x.observation_types = x.observation.columns.to_list()
+
+    # store SNR observations as float32 to halve the memory and disk footprint
+    x.observation = _downcast(x.observation)
+        
+    # resample if required
+    if interval is not None:
+        x = resample_obs(x,interval)
+    return x
+
 def subset_vars(df,keepvars,force_epoch_system=True):
     # find all matches for all elements of keepvars
-    keepvars = np.concatenate([fnmatch.filter(df.columns.tolist(),x) for x in keepvars])
-    # subselect those of the required columns that are present 
-    tokeep = np.intersect1d(keepvars,df.columns.tolist())
+    columns = df.columns.tolist()
+    tokeep = set()
+    for x in keepvars:
+        tokeep.update(fnmatch.filter(columns,x))
     # + always keep 'epoch' and 'SYSTEM' as they are required for calculating azimuth and elevation
     if force_epoch_system:
-        tokeep = np.unique(np.concatenate((keepvars,['epoch','SYSTEM'])))
-    else:
-        tokeep = np.unique(keepvars)
+        tokeep |= {'epoch','SYSTEM'}
     # find columns not to keep
-    todrop = np.setdiff1d(df.columns.tolist(),tokeep)
+    todrop = [x for x in columns if x not in tokeep]
     # drop unneeded columns
     if len(todrop)>0:
         df = df.drop(columns=todrop)
     # drop rows for which all of the required vars are NA
-    df = df.dropna(how='all')
+    df = _dropna_all(df)
+    return df
+
+def _dropna_all(df):
+    # equivalent of df.dropna(how='all') but the NA mask of all float columns is
+    # computed in a single numpy reduction instead of column by column
+    is_float_col = [x.kind=='f' for x in df.dtypes]
+    allna = np.ones(len(df), dtype=bool)
+    if any(is_float_col):
+        allna &= np.all(np.isnan(df.loc[:,is_float_col].to_numpy()),axis=1)
+    for col,flag in zip(df.columns,is_float_col):
+        if not allna.any():
+            break
+        if not flag:
+            allna &= df[col].isna().to_numpy()
+    if allna.any():
+        df = df.iloc[~allna]
+    return df
+
+def _dedup_sorted(df):
+    # drops rows with a duplicated index, keeping the first occurrence
+    # once the index is sorted, duplicates are adjacent and can be found by comparing 
+    # the integer codes of neighbouring rows instead of hashing every index tuple
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    mask = np.ones(len(df), dtype=bool)
+    if len(df)>1:
+        mask[1:] = False
+        for codes in df.index.codes:
+            mask[1:] |= (codes[1:]!=codes[:-1])
+    # in the usual case without duplicates, the dataframe is returned without copying it
+    if mask.all():
+        return df
+    return df.iloc[mask]
+
+def _downcast(df,patterns=('S?','S??')):
+    # SNR observations and angles only have a few significant digits and can safely be stored as float32
+    # pseudoranges, carrier phases and dopplers need float64 to keep their precision and are left untouched
+    tocast = [x for x in df.columns if any(fnmatch.fnmatch(x,p) for p in patterns) and df[x].dtype!=np.float32]
+    if len(tocast)>0:
+        df = df.astype({x:np.float32 for x in tocast})
     return df
 
 def resample_obs(obs,interval):
     # list all variables except SYSTEM and epoch as these are recalculated separately
     subset = np.setdiff1d(obs.observation.columns.to_list(),['epoch','SYSTEM'])
     # resample using the temporal average
-    obs.observation = obs.observation[subset].groupby([pd.Grouper(freq=interval, level='Epoch'),pd.Grouper(level='SV')]).mean()
+    obs.observation = _binned_mean(obs.observation[subset],interval)
     # restore SYSTEM and epoch
     obs.observation['epoch'] = obs.observation.index.get_level_values('Epoch')
-    obs.observation['SYSTEM'] = _system_name(obs.observation.index.get_level_values("SV"))
+    # the system name is only derived once per unique SV and then gathered with the integer codes of the SV level
+    isv = obs.observation.index.names.index('SV')
+    systems = np.array(_system_name(obs.observation.index.levels[isv]),dtype=object)
+    obs.observation['SYSTEM'] = systems[obs.observation.index.codes[isv]]
     obs.interval = pd.Timedelta(interval).seconds
     return obs
 
-def add_azi_ele(obs, orbit_data=None):
-    start_time = min(obs.observation.index.get_level_values('Epoch'))
-    end_time = max(obs.observation.index.get_level_values('Epoch'))
-    
+def _binned_mean(df,interval):
+    # same result as df.groupby([pd.Grouper(freq=interval, level='Epoch'),pd.Grouper(level='SV')]).mean()
+    # each row is assigned a single integer key (time bin, SV) and all columns are averaged
+    # with np.bincount, which avoids the generic groupby machinery
+    if len(df)==0:
+        return df.groupby([pd.Grouper(freq=interval, level='Epoch'),pd.Grouper(level='SV')]).mean()
+    freq = pd.Timedelta(interval).value
+    epochs = df.index.get_level_values('Epoch').values.astype('datetime64[ns]').view(np.int64)
+    svcodes, svs = pd.factorize(df.index.get_level_values('SV'),sort=True)
+    # bins start at midnight of the first day, like the default origin of pd.Grouper
+    first = epochs.min()
+    origin = first-first%pd.Timedelta('1D').value
+    keys = ((epochs-origin)//freq)*len(svs)+svcodes
+    ukeys, inverse = np.unique(keys,return_inverse=True)
+    out = dict()
+    for col in df.columns:
+        values = df[col].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values)
+        sums = np.bincount(inverse[valid],weights=values[valid],minlength=len(ukeys))
+        counts = np.bincount(inverse[valid],minlength=len(ukeys))
+        with np.errstate(invalid='ignore'):
+            out[col] = (sums/counts).astype(df[col].dtype)
+    index = pd.MultiIndex.from_arrays([pd.to_datetime(origin+(ukeys//len(svs))*freq),svs[ukeys%len(svs)]],names=['Epoch','SV'])
+    return pd.DataFrame(out,index=index)
+
+def add_azi_ele(obs, orbit_data=None, cachedir=None):
+    # the orbit is interpolated over the span of the observations (plus the buffer added by sp3_interp_fast)
+    # orbit_data is a dictionary of the orbits of the last spans, keyed by (start_time, end_time, interval)
+    # passing the orbit_data returned by a previous call recycles any of them that covers the new observations
     if orbit_data is None:
-        do = True
-    elif (orbit_data.start_time<start_time) and (orbit_data.end_time>end_time) and (orbit_data.interval==obs.interval):
-        # if the orbit for the day corresponding to the epoch and interval is the same as the one that was passed, just reuse it. This drastically reduces the number of times orbit files have to be read and interpolated.
-        do = False
+        orbit_data = dict()
+    # the first and last epochs only need a single pass over the epochs
+    epochs = obs.observation.index.get_level_values('Epoch').values
+    start_time = pd.Timestamp(epochs.min())
+    end_time = pd.Timestamp(epochs.max())
+    # if an orbit covers the epochs and interval, just reuse it. This drastically reduces the number of times orbit files have to be read and interpolated.
+    key = next((x for x,y in orbit_data.items() if _orbit_covers(y,start_time,end_time,obs.interval)),None)
+    if key is None:
+        orbit = _orbit_of_span(start_time,end_time,obs.interval,cachedir)
+        key = (orbit.start_time,orbit.end_time,obs.interval)
     else:
-        do = True
-    
-    if do:
-        # read (=usually download) orbit data
-        orbit = sp3_interp_fast(start_time, end_time, interval=obs.interval)
-        # prepare an orbit object as well
-        orbit_data = orbit
-        orbit_data.start_time = orbit.index.get_level_values('Epoch').min()
-        orbit_data.end_time = orbit.index.get_level_values('Epoch').max()
-        orbit_data.interval = obs.interval
-    else:
-        orbit = orbit_data
+        orbit = orbit_data.pop(key)
+    # the orbit that was just used goes last, and only the last two spans are kept to bound memory usage
+    orbit_data[key] = orbit
+    for x in list(orbit_data.keys())[:-2]:
+        del orbit_data[x]
     
     # calculate the gnss parameters (including azimuth and elevation)
     gnssdf = gnssDataframe(obs,orbit,cut_off=-10)
     # add the gnss parameters to the observation dataframe
-    obs.observation = obs.observation.join(gnssdf[['Azimuth','Elevation']])
+    obs.observation = _add_columns_on_index(obs.observation,gnssdf[['Azimuth','Elevation']])
+    # float32 resolves angles to better than 1e-5 degrees, which is more than enough
+    obs.observation = _downcast(obs.observation,patterns=('Azimuth','Elevation'))
     # drop variables 'epoch' and 'SYSTEM' as they are not needed anymore by gnssDataframe
     obs.observation = obs.observation.drop(columns=['epoch','SYSTEM'])
     # update the observation_types list
     obs.observation_types = obs.observation.columns.to_list()
     return obs, orbit_data
 
+def _add_columns_on_index(df,other):
+    # same result as df.join(other) when the index of other is unique
+    # the row position of each (Epoch,SV) is looked up on the integer codes of the index and the
+    # columns are gathered with numpy instead of going through a hash join on index tuples
+    if not other.index.is_unique:
+        return df.join(other)
+    pos = other.index.get_indexer(df.index)
+    found = pos>=0
+    df = df.copy()
+    for col in other.columns:
+        values = other[col].to_numpy()
+        out = np.full(len(df),np.nan,dtype=np.result_type(values.dtype,np.float64))
+        out[found] = values[pos[found]]
+        df[col] = out
+    return df
+
+def _orbit_of_span(start_time,end_time,interval,cachedir=None):
+    # returns the orbit interpolated between start_time and end_time, trying first to recover it 
+    # from the on-disk cache of previous runs, where it is stored under the requested span and interval
+    orbit = None
+    if cachedir is not None:
+        cachefile = os.path.join(cachedir,f"orbit_{start_time.strftime('%Y%m%d%H%M%S')}_{end_time.strftime('%Y%m%d%H%M%S')}_{interval}s.pkl")
+        if os.path.exists(cachefile):
+            with open(cachefile,'rb') as f:
+                orbit = pickle.load(f)
+    if orbit is None:
+        # read (=usually download) orbit data
+        orbit = sp3_interp_fast(start_time, end_time, interval=interval, cachedir=cachedir)
+        if cachedir is not None:
+            os.makedirs(cachedir,exist_ok=True)
+            # write to a temporary file first so that an interrupted write never leaves a corrupted cache
+            tmpfile = f"{cachefile}.{os.getpid()}.tmp"
+            with open(tmpfile,'wb') as f:
+                pickle.dump(orbit,f,protocol=5)
+            os.replace(tmpfile,cachefile)
+    # prepare an orbit object as well
+    return _set_orbit_attrs(orbit,interval)
+
+def _set_orbit_attrs(orbit,interval):
+    # store the time span and interval of the orbit data for checking whether it can be recycled
+    epochs = orbit.index.get_level_values('Epoch')
+    orbit.start_time = epochs.min()
+    orbit.end_time = epochs.max()
+    orbit.interval = interval
+    return orbit
+
+def _orbit_covers(orbit,start_time,end_time,interval):
+    return (orbit.start_time<=start_time) and (orbit.end_time>=end_time) and (orbit.interval==interval)
+
+def _df_to_ds(df):
+    # equivalent of df.to_xarray() for a dataframe with a unique MultiIndex
+    # each column is scattered directly into a dense array with one dimension per index level,
+    # using the integer codes of the index as positions instead of unstacking the dataframe
+    index = df.index.remove_unused_levels()
+    shape = tuple(len(level) for level in index.levels)
+    data_vars = dict()
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if values.dtype.kind in 'fcmM':
+            # floats and datetimes can hold missing values
+            array = np.full(shape,np.nan,dtype=values.dtype)
+        elif values.dtype.kind in 'iu':
+            array = np.full(shape,np.nan,dtype=float)
+        else:
+            array = np.full(shape,np.nan,dtype=object)
+        array[tuple(index.codes)] = values
+        data_vars[col] = (index.names,array)
+    coords = {name:level.values for name,level in zip(index.names,index.levels)}
+    return xr.Dataset(data_vars,coords=coords)
+
+def _to_netcdf(ds,out_path,compress=True):
+    # write the dataset in a single pass with the h5netcdf engine
+    # mode='w' overwrites any existing file so there is no need to delete it beforehand
+    if compress:
+        encodings = dict()
+        for x in list(ds.keys()):
+            if any([fnmatch.fnmatch(x,y) for y in ['S??','S?','Azimuth','Elevation']]):
+                enc = {"dtype": "int16", "scale_factor": 0.1, "_FillValue":-9999}
+            else:
+                enc = dict()
+            # fast lossless compression, the shuffle filter groups the bytes of each value to help zlib
+            enc.update({"zlib": True, "complevel": 1, "shuffle": True, 
+                        "chunksizes": _chunksizes(ds[x].dims,ds[x].shape,np.dtype(enc.get("dtype",ds[x].dtype)).itemsize)})
+            encodings[x] = enc
+    else:
+        encodings = {x:{"zlib": False} for x in list(ds.keys())}
+    ds.to_netcdf(out_path,mode='w',engine='h5netcdf',encoding=encodings)
+
+def _save_ds(ds,out_path,compress,nobs):
+    # writes the dataset and reports it, so that the message is only printed once the file exists
+    _to_netcdf(ds,out_path,compress)
+    print(f"Saved {nobs:n} individual observations in {os.path.basename(out_path)}")
+
+def _chunksizes(dims,shape,itemsize,minbytes=2**16):
+    # chunks are blocks of epochs spanning all other dimensions (e.g. (Epoch,SV) in preprocessed files 
+    # and (Station,Epoch,SV) in gathered files) and contain at least minbytes (unless the variable 
+    # is smaller than that), as zlib performs poorly on small chunks
+    # variables without an Epoch dimension are chunked along their first dimension
+    if len(shape)==0 or 0 in shape:
+        return None
+    axis = list(dims).index('Epoch') if 'Epoch' in dims else 0
+    inner = int(np.prod(shape))//shape[axis]
+    chunks = list(shape)
+    chunks[axis] = min(shape[axis],max(1,-(-minbytes//(inner*itemsize))))
+    return tuple(chunks)
+
 def get_filelist(filepatterns):
     if not isinstance(filepatterns,dict):
         raise Exception(f"Expected the input of get_filelist to be a dictionary, got a {type(filepatterns)} instead")
@@ -244,21 +457,125 @@ def get_filelist(filepatterns):
     for item in filepatterns.items():
         station_name = item[0]
         search_pattern = item[1]
-        flist = glob.glob(search_pattern)
+        flist = _list_matching(search_pattern)
         if len(flist)==0:
             print(f"Could not find any files matching the pattern {search_pattern}")
         filelists[station_name] = flist
     return filelists
 
+def _list_matching(search_pattern):
+    # when only the file name contains wildcards, the directory is read once with os.scandir
+    # and the names are matched with fnmatch, which avoids the per-file stat calls of glob
+    dirname, pattern = os.path.split(search_pattern)
+    if glob.has_magic(dirname) or not pattern:
+        return glob.glob(search_pattern)
+    try:
+        with os.scandir(dirname if dirname else os.curdir) as it:
+            names = [x.name for x in it]
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    # like glob, hidden files are only matched if the pattern explicitly starts with a dot
+    if not pattern.startswith('.'):
+        names = [x for x in names if not x.startswith('.')]
+    return [os.path.join(dirname,x) for x in fnmatch.filter(names,pattern)]
+
 
 #--------------------------------------------------------------------------
 #----------------- PAIRING OBSERVATION FILES FROM SITES -------------------
 #-------------------------------------------------------------------------- 
 
-def gather_stations(filepattern,pairings,timeintervals,keepvars=None,outputdir=None,compress=True):
+def _split_intervals(df,timeintervals):
+    # returns a list of (interval, dataframe) tuples with the rows of df falling in each of the timeintervals
+    # each Epoch is assigned the integer code of its interval with a binary search on the interval bounds 
+    # (timeintervals are expected to be sorted and non-overlapping), rows outside of all intervals get -1
+    epochs = df.index.get_level_values('Epoch').values.astype('datetime64[ns]').view('i8')
+    lefts = timeintervals.left.values.astype('datetime64[ns]').view('i8')
+    rights = timeintervals.right.values.astype('datetime64[ns]').view('i8')
+    if timeintervals.closed_right:
+        codes = np.searchsorted(rights,epochs,side='left')
+    else:
+        codes = np.searchsorted(rights,epochs,side='right')
+    valid = codes<len(timeintervals)
+    if timeintervals.closed_left:
+        valid[valid] = lefts[codes[valid]]<=epochs[valid]
+    else:
+        valid[valid] = lefts[codes[valid]]<epochs[valid]
+    codes[~valid] = -1
+    # rows are ordered by interval code (the stable sort keeps their original order within each interval)
+    # and each interval is then a contiguous slice. If the epochs are already sorted, so are the codes
+    if np.all(codes[1:]>=codes[:-1]):
+        order = None
+    else:
+        order = np.argsort(codes,kind='stable')
+        codes = codes[order]
+    starts = np.searchsorted(codes,np.arange(len(timeintervals)),side='left')
+    ends = np.searchsorted(codes,np.arange(len(timeintervals)),side='right')
+    if order is None:
+        return [(timeintervals[i],df.iloc[starts[i]:ends[i]]) for i in range(len(timeintervals))]
+    else:
+        return [(timeintervals[i],df.iloc[order[starts[i]:ends[i]]]) for i in range(len(timeintervals))]
+
+def _open_epoch_range(filename):
+    # lazily opens a NetCDF file and returns the dataset with the first and last timestamps of its Epoch coordinate
+    # the dataset is kept open so that it can be reused if the file is needed
+    ds = xr.open_dataset(filename,chunks={})
+    epochs = ds['Epoch'].values
+    return ds, pd.Timestamp(epochs.min()), pd.Timestamp(epochs.max())
+
+def _gather_case(case_name,station_names,filenames,timeintervals,keepvars):
+    # gathers the data of all stations of one case and splits it according to timeintervals
+    # returns the case name and the list of (interval, dataframe) tuples
+    print(f'Processing {case_name}')
+    # define time interval over which we will need data
+    overall_interval = pd.Interval(left=timeintervals.min().left,right=timeintervals.max().right)
+    print(f'Listing the files matching with the interval')
+    iout = []
+    for station_name in station_names:
+        # open each file and get the range of Epochs it covers
+        with ThreadPoolExecutor() as executor:
+            opened = list(executor.map(_open_epoch_range,filenames[station_name]))
+        datasets = [x[0] for x in opened]
+        lefts = np.array([x[1] for x in opened],dtype='datetime64[ns]')
+        rights = np.array([x[2] for x in opened],dtype='datetime64[ns]')
+        # check which files have data that overlaps with the desired time intervals
+        # (same test as pd.Interval.overlaps for right-closed intervals, done on all files at once)
+        isin = (lefts < overall_interval.right.to_datetime64()) & (rights > overall_interval.left.to_datetime64())
+        print(f'Found {sum(isin)} files for {station_name}')
+        print(f'Reading')
+        # files that are not needed are closed right away
+        for i in np.flatnonzero(~isin):
+            datasets[i].close()
+        # order those files chronologically: since each file is already sorted, the concatenated 
+        # data will then only need to be sorted again if some of the files overlap in time
+        # (if files overlap, duplicated observations are taken from the file that starts first)
+        selected = [datasets[x] for x in np.flatnonzero(isin)[np.argsort(lefts[isin],kind='stable')]]
+        # only the required variables are loaded in memory
+        if keepvars is not None:
+            selected = [x[[y for y in x.data_vars if any([fnmatch.fnmatch(y,z) for z in keepvars])]] for x in selected]
+        # concatenate the already opened files along the Epoch dimension and convert them to a pandas dataframe
+        idata = xr.concat(selected,dim='Epoch')
+        idata = _dropna_all(idata.to_dataframe())
+        for ds in selected:
+            ds.close()
+        # sort the dataframe (if needed) and drop duplicates
+        idata = _dedup_sorted(idata)
+        # add the station data in the iout list
+        iout.append(idata)
+    
+    print(f'Concatenating')
+    iout = pd.concat(iout, keys=station_names, names=['Station'])
+    # only keep required vars and drop potential empty rows
+    if keepvars is not None:
+        iout = subset_vars(iout,keepvars,force_epoch_system=False)
+    # split the dataframe into multiple dataframes according to timeintervals
+    return case_name, _split_intervals(iout,timeintervals)
+
+def gather_stations(filepattern,pairings,timeintervals,keepvars=None,outputdir=None,compress=True,n_jobs=1):
     """
     Merges observations from different sites according to specified pairing rules over the desired time intervals.
     The new dataframe will contain a new index level corresponding to each site, with keys corresponding to station names.
+    If files of a station overlap in time, observations found in several files are taken from the file that starts first
+    (files starting at the same time are taken in the order in which they match the file pattern).
     
     Parameters
     ----------
@@ -291,6 +608,12 @@ def gather_stations(filepattern,pairings,timeintervals,keepvars=None,outputdir=N
     compress: bool (optional)
         If True, will save all SNR, Azimuth, and Elevation data as int16 with a scale factor to restore the first decimal
         Encoding for these variables will be {"dtype": "int16", "scale_factor": 0.1, "zlib": True, "_FillValue":-9999}
+        All variables are compressed with zlib (complevel=1) and the shuffle filter, in chunks of at least 64 kB
+
+    n_jobs: int (optional)
+        Number of processes used to gather the cases of 'pairings' in parallel
+        If 1 (default), cases are gathered sequentially. If -1, all available cores are used
+        Each process holds the data of one case in memory
         
     Returns
     -------
@@ -298,41 +621,11 @@ def gather_stations(filepattern,pairings,timeintervals,keepvars=None,outputdir=N
     data for each time interval contained in the 'timeperiod' argument.
     
     """
-    out=dict()
-    for item in pairings.items():
-        case_name = item[0]
-        station_names = item[1]
-        print(f'Processing {case_name}')
-        # define time interval over which we will need data
-        overall_interval = pd.Interval(left=timeintervals.min().left,right=timeintervals.max().right)
-        print(f'Listing the files matching with the interval')
-        # get all files for all stations
-        filenames = get_filelist(filepattern)
-        iout = []
-        for station_name in station_names:
-            # get Epochs from all files
-            epochs = [xr.open_mfdataset(x).Epoch for x in filenames[station_name]]
-            # check which files have data that overlaps with the desired time intervals
-            isin = [overall_interval.overlaps(pd.Interval(left=pd.Timestamp(x.values.min()),
-                                                          right=pd.Timestamp(x.values.max()))) for x in epochs]
-            print(f'Found {sum(isin)} files for {station_name}')
-            print(f'Reading')
-            # open those files and convert them to pandas dataframes
-            idata = [xr.open_mfdataset(x).to_dataframe().dropna(how='all') \
-                    for x in np.array(filenames[station_name])[isin]]
-            # concatenate, drop duplicates and sort the dataframes
-            idata = pd.concat(idata)
-            idata = idata[~idata.index.duplicated()].sort_index(level=['Epoch','SV'])
-            # add the station data in the iout list
-            iout.append(idata)
-        
-        print(f'Concatenating')
-        iout = pd.concat(iout, keys=station_names, names=['Station'])
-        # only keep required vars and drop potential empty rows
-        if keepvars is not None:
-            iout = subset_vars(iout,keepvars,force_epoch_system=False)
-        # split the dataframe into multiple dataframes according to timeintervals
-        out[case_name] = [x for x in iout.groupby(pd.cut(iout.index.get_level_values('Epoch').tolist(), timeintervals))]
+    # get all files for all stations
+    filenames = get_filelist(filepattern)
+    # gather each case (possibly in parallel processes)
+    cases = [(item[0],item[1],filenames,timeintervals,keepvars) for item in pairings.items()]
+    out = dict(imap(_gather_case,cases,n_jobs))
         
     # output the files
     if outputdir:
@@ -351,22 +644,11 @@ def gather_stations(filepattern,pairings,timeintervals,keepvars=None,outputdir=N
                 filename = f"{case_name}_{ts}.nc"
                 # convert dataframe to xarray for saving to netcdf (if df is not empty)
                 if len(df[1])>0:
-                    ds = df[1].to_xarray()
+                    ds = _df_to_ds(df[1])
                     # sort dimensions
                     ds = ds.sortby(['Epoch','SV','Station'])
                     out_path = os.path.join(ioutputdir,filename)
-                    if os.path.exists(out_path):
-                        os.remove(out_path)
-                    if compress:
-                        enc = {"dtype": "int16", "scale_factor": 0.1, "zlib": True, "_FillValue":-9999}
-                        to_compress = [fnmatch.fnmatch(x,'S??') | 
-                                       fnmatch.fnmatch(x,'S?') | 
-                                       fnmatch.fnmatch(x,'Azimuth') | 
-                                       fnmatch.fnmatch(x,'Elevation') for x in list(ds.keys())]
-                        encodings = {x:enc for x in np.array(list(ds.keys()))[to_compress]}
-                        ds.to_netcdf(out_path,encoding=encodings)
-                    else:
-                        ds.to_netcdf(out_path)
+                    _to_netcdf(ds,out_path,compress)
                     print(f"Saved {len(df[1])} obs in {filename}")
                 else:
                     print(f"No data for timestep {ts}, no file saved")
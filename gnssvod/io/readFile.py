@@ -187,22 +187,43 @@ def read_obsFile(observationFile,header=False):
         raise Warning("All I/O functions take uncompressed files as an input (remove .Z/.gz from filename) | Next release will include this feature...")
     # check if observationFile exists or not
     isexist(observationFile)
-    # open file
+    # open file and only read the lines up to the version line, the whole file is read by the version-specific reader
     f = open(observationFile, errors = 'ignore')
-    obsLines = f.readlines()
-    line = 0
-    while True:
-        if 'RINEX VERSION / TYPE' in obsLines[line]:
-            version = obsLines[line][0:-20].split()[0]
+    for obsLine in f:
+        if 'RINEX VERSION / TYPE' in obsLine:
+            version = obsLine[0:-20].split()[0]
             break
-        else:
-            line += 1
     f.close()
     if version.startswith("2"):
         return read_obsFile_v2(observationFile,header)
     elif version.startswith("3"):
         return read_obsFile_v3(observationFile,header)
 
+def _fixed_width_floats(records,nfields,offset=0,width=14,step=16):
+    # converts fixed-width observation fields to floats, returns a (records x nfields) array
+    # all records are packed in a single byte buffer and each field is converted for all records 
+    # at once by numpy. Blank or unreadable fields are returned as NaN
+    out = np.full((len(records),nfields), np.nan)
+    if len(records)==0 or nfields==0:
+        return out
+    length = offset+step*(nfields-1)+width
+    buffer = ''.join([x[:length].ljust(length) for x in records]).encode('ascii',errors='replace')
+    chars = np.frombuffer(buffer,dtype='S1').reshape(len(records),length)
+    for i in range(nfields):
+        field = np.ascontiguousarray(chars[:,offset+i*step:offset+i*step+width]).view(f'S{width}').ravel()
+        filled = np.char.strip(field)!=b''
+        try:
+            out[filled,i] = field[filled].astype(np.float64)
+        except ValueError:
+            # some fields are not valid numbers, fall back to converting them one by one
+            out[filled,i] = [float(x) if isfloat(x) else np.nan for x in field[filled]]
+    return out
+
+def _system_column(svs):
+    # the system name is only derived once per unique SV and then mapped back onto all rows
+    codes, uniques = pd.factorize(svs)
+    return np.array(_system_name(uniques),dtype=object)[codes]
+
 def read_obsFile_v2(observationFile,header=False):
     """ Function that reads RINEX observation file """
     start = time.time()
@@ -255,29 +276,34 @@ def read_obsFile_v2(observationFile,header=False):
                      start_date,end_date,version,ToB)
     # --------------------------------------------------------------------------------------
     obsLines = [lines.rstrip() for lines in obsLines] 
-    obsList = []
+    records = []
     SVList= []
     epochList = []
+    recordEpochs = []
+    # lines are not deleted once read (which is slow for long files), currentline points to the next line instead
+    currentline = 0
+    rowNumber = np.ceil(obsNumber/5).astype('int')
     while True:
         # --------------------------------------------------------------------------------------
         while True:
-            if 'COMMENT' in obsLines[0]:
-                del obsLines[0]
+            if 'COMMENT' in obsLines[currentline]:
+                currentline += 1
                 line += 1
-            elif 'APPROX POSITION XYZ' in obsLines[0]:
-                del obsLines[0]
+            elif 'APPROX POSITION XYZ' in obsLines[currentline]:
+                currentline += 1
                 line += 1
-            elif 'REC # / TYPE / VERS' in obsLines[0]:
+            elif 'REC # / TYPE / VERS' in obsLines[currentline]:
                 raise Warning("Receiver type is changed! | Exiting...")
-            elif isint(obsLines[0][1:3])==False:
-                print("Line", line, ":", obsLines[0]) # bu satırı sil!!!!
-                del obsLines[0]
+            elif isint(obsLines[currentline][1:3])==False:
+                print("Line", line, ":", obsLines[currentline])
+                currentline += 1
                 line += 1
                 print('Unexpected format between epochs! Line', line,'is deleted!')
             else:
                 break
         #---------------------------------------------------------------------------------------
-        year = int(obsLines[0][1:3])
+        epochLine = obsLines[currentline]
+        year = int(epochLine[1:3])
         if 79 < year < 100:
             year += 1900
         elif year <= 79:
@@ -285,75 +311,64 @@ def read_obsFile_v2(observationFile,header=False):
         else:
             raise Warning('Observation year is not recognized! | Program stopped!')
         epoch = datetime.datetime(year = year, 
-                                month =int(obsLines[0][4:6]),
-                                day =int(obsLines[0][7:9]),
-                                hour = int(obsLines[0][10:12]),
-                                minute = int(obsLines[0][13:15]),
-                                second  = int(obsLines[0][16:18])  if isint(obsLines[0][16:18])==True else 0)
-                                #microsecond  = int(obsLines[0][20:27])  if isint(obsLines[0][19:20])==True else 0)
+                                month =int(epochLine[4:6]),
+                                day =int(epochLine[7:9]),
+                                hour = int(epochLine[10:12]),
+                                minute = int(epochLine[13:15]),
+                                second  = int(epochLine[16:18])  if isint(epochLine[16:18])==True else 0)
         epochList.append(epoch)
-        eflag = int(obsLines[0][28:30])
+        eflag = int(epochLine[28:30])
         if eflag == 4:
-            del obsLines[0]
+            currentline += 1
             while True:
-                if 'COMMENT' in obsLines[0]:
-                    print(obsLines[0])
-                    del obsLines[0]
+                if 'COMMENT' in obsLines[currentline]:
+                    print(obsLines[currentline])
+                    currentline += 1
                     line += 1
                 else: 
                     break
+            epochLine = obsLines[currentline]
 
-        if len(obsLines[0]) == 80:
-            receiver_clock = float(obsLines[0][-12:])
-            obsLines[0] = obsLines[0][:-12]
+        if len(epochLine) == 80:
+            receiver_clock = float(epochLine[-12:])
+            epochLine = epochLine[:-12]
         else:
             receiver_clock = 0
         #---------------------------------------------------------------------------------------
-        NoSV  = int(obsLines[0][30:32])
+        NoSV  = int(epochLine[30:32])
         #---------------------------------------------------------------------------------------
-        if len(obsLines[0][32:]) != 3*NoSV:
-            noLine = [int(NoSV/12) if NoSV % 12 != 0 else int(NoSV/12)-1]
-            for i in range(noLine[0]):
-                obsLines[0] = obsLines[0] + obsLines[1][32:]
-                del obsLines[1]
-            if len(obsLines[0][32:]) != 3*NoSV:
-                obsLines[0] = " " + obsLines[0].strip()
+        if len(epochLine[32:]) != 3*NoSV:
+            noLine = int(NoSV/12) if NoSV % 12 != 0 else int(NoSV/12)-1
+            for i in range(noLine):
+                epochLine = epochLine + obsLines[currentline+1+i][32:]
+            currentline += noLine
+            if len(epochLine[32:]) != 3*NoSV:
+                epochLine = " " + epochLine.strip()
         #---------------------------------------------------------------------------------------
-        SV=[obsLines[0][32:][i:i+3] for i in range(0, len(obsLines[0][32:]), 3)]
+        SV=[epochLine[32:][i:i+3] for i in range(0, len(epochLine[32:]), 3)]
         SV = [i.replace('  ', 'G0') for i in SV]
         SV = [i.replace(' ', 'G') if i[0]==' ' else i.replace(' ', '0') for i in SV]
         SVList.extend(SV)
         #---------------------------------------------------------------------------------------
-        obsEpoch = []
-        del obsLines[0]
-        rowNumber = np.ceil(obsNumber/5).astype('int')
-        for i in range(0, rowNumber*NoSV, rowNumber): 
-            for j in range(0, rowNumber):
-                lineLenght = len(obsLines[i+j])
-                if lineLenght != 80:
-                    obsLines[i+j] += ' '*(80-lineLenght)
-                if j!=0:
-                    obsLines[i] += obsLines[i+j]
-            obsLines[i] = [float(obsLines[i][j:j+14]) if isfloat(obsLines[i][j:j+14])==True else None for j in range(0, 80*rowNumber, 16)]
-            if len(obsLines[i]) != obsNumber:
-                del obsLines[i][-(len(obsLines[i])-obsNumber):]
-            obsLines[i].append(epoch)
-            obsEpoch.append(obsLines[i])
-        obsList.extend(obsEpoch)
-        del obsLines[0:rowNumber*NoSV]
-        if len(obsLines) == 0:
+        currentline += 1
+        # the lines of each satellite are joined (each padded to 80 characters) into a single record,
+        # all records are converted to numbers at once after the whole file is read
+        for i in range(currentline, currentline+rowNumber*NoSV, rowNumber):
+            records.append(''.join([obsLines[i+j].ljust(80) for j in range(rowNumber)]))
+        recordEpochs.extend([epoch]*NoSV)
+        currentline += rowNumber*NoSV
+        if currentline >= len(obsLines):
             break
-    columnNames = ToB[1:]
-    columnNames.append('Epoch')
     SVList = [x.replace(' ','0') if x[1]==' ' else x for x in SVList] # replace 'G 1' with 'G01' (etc)
-    observation = pd.DataFrame(obsList, index=SVList, columns=columnNames)
+    observation = pd.DataFrame(_fixed_width_floats(records,obsNumber), index=SVList, columns=ToB[1:])
+    observation['Epoch'] = recordEpochs
     observation.index.name = 'SV'
     observation['epoch'] = observation.Epoch
     observation['Epoch'] = observation.Epoch
     observation.set_index('Epoch', append=True, inplace=True)
     observation = observation.reorder_levels(['Epoch', 'SV'])
 
-    observation["SYSTEM"] = _system_name(observation.index.get_level_values("SV"))
+    observation["SYSTEM"] = _system_column(observation.index.get_level_values("SV"))
     #---------------------------------------------------------------------------------------
     fileEpoch = datetime.date(year = epoch.year,
                                 month = epoch.month,
@@ -494,9 +509,10 @@ def read_obsFile_v3(obsFileName,header):
     # --------------------------------------------------------------------------------------
     # =============================================================================
     obsLines = [lines.rstrip() for lines in obsLines]
-    obsList = []
+    svLines = []
     svList= []
     epochList = []
+    recordEpochs = []
     currentline = 0
     last_update = start
     while True:
@@ -558,26 +574,10 @@ def read_obsFile_v3(obsFileName,header):
             currentline += 1 # move beyond header line
             # =============================================================================
             epoch_SVNumber = int(epoch_SVNumber)
-            for svLine in range(currentline,currentline+epoch_SVNumber):
-                obsEpoch = np.full((1,len(ToB)), None)
-                svList.append(obsLines[svLine][:3])
-                if obsLines[svLine].startswith("G"):
-                    obsEpoch[0,index_GPS] = np.array([[float(obsLines[svLine][3:][i:i+14]) if isfloat(obsLines[svLine][3:][i:i+14])==True else None for i in range(0,len(ToB_GPS)*16,16)]])
-                elif obsLines[svLine].startswith("R"):
-                    obsEpoch[0,index_GLONASS] = np.array([[float(obsLines[svLine][3:][i:i+14]) if isfloat(obsLines[svLine][3:][i:i+14])==True else None for i in range(0,len(ToB_GLONASS)*16,16)]])
-                    #obsEpoch[svLine,index_GLONASS]
-                elif obsLines[svLine].startswith("E"):
-                    obsEpoch[0,index_GALILEO] = np.array([[float(obsLines[svLine][3:][i:i+14]) if isfloat(obsLines[svLine][3:][i:i+14])==True else None for i in range(0,len(ToB_GALILEO)*16,16)]])
-                elif obsLines[svLine].startswith("C"):
-                    obsEpoch[0,index_COMPASS] = np.array([[float(obsLines[svLine][3:][i:i+14]) if isfloat(obsLines[svLine][3:][i:i+14])==True else None for i in range(0,len(ToB_COMPASS)*16,16)]])
-                elif obsLines[svLine].startswith("J"):
-                    obsEpoch[0,index_QZSS] = np.array([[float(obsLines[svLine][3:][i:i+14]) if isfloat(obsLines[svLine][3:][i:i+14])==True else None for i in range(0,len(ToB_QZSS)*16,16)]])
-                elif obsLines[svLine].startswith("I"):
-                    obsEpoch[0,index_IRSS] = np.array([[float(obsLines[svLine][3:][i:i+14]) if isfloat(obsLines[svLine][3:][i:i+14])==True else None for i in range(0,len(ToB_IRSS)*16,16)]])
-                elif obsLines[svLine].startswith("S"):
-                    obsEpoch[0,index_SBAS] = np.array([[float(obsLines[svLine][3:][i:i+14]) if isfloat(obsLines[svLine][3:][i:i+14])==True else None for i in range(0,len(ToB_SBAS)*16,16)]])
-                obsEpoch = np.append(obsEpoch,epoch)
-                obsList.append(obsEpoch)
+            # the lines of each satellite are converted to numbers at once after the whole file is read
+            svLines.extend(obsLines[currentline:currentline+epoch_SVNumber])
+            svList.extend([x[:3] for x in obsLines[currentline:currentline+epoch_SVNumber]])
+            recordEpochs.extend([epoch]*epoch_SVNumber)
             # =============================================================================
             currentline += epoch_SVNumber # number of rows in epoch equals number of visible satellites in RINEX 3
         if currentline == len(obsLines):
@@ -659,16 +659,28 @@ def read_obsFile_v3(obsFileName,header):
             break
     """
     # =============================================================================
-    columnNames = ToB
-    columnNames = np.append(ToB,'Epoch')
+    # the observations of each constellation are converted in one go and placed in their respective columns
+    values = np.full((len(svLines),len(ToB)), np.nan)
+    systems = np.array([x[:1] for x in svLines])
+    for system, ToB_system, index_system in [("G",ToB_GPS,index_GPS),
+                                             ("R",ToB_GLONASS,index_GLONASS),
+                                             ("E",ToB_GALILEO,index_GALILEO),
+                                             ("C",ToB_COMPASS,index_COMPASS),
+                                             ("J",ToB_QZSS,index_QZSS),
+                                             ("I",ToB_IRSS,index_IRSS),
+                                             ("S",ToB_SBAS,index_SBAS)]:
+        rows = np.flatnonzero(systems==system)
+        if len(rows)>0 and len(ToB_system)>0:
+            values[np.ix_(rows,index_system)] = _fixed_width_floats([svLines[x] for x in rows],len(ToB_system),offset=3)
     svList = [x.replace(' ','0') if x[1]==' ' else x for x in svList] # replace 'G 1' with 'G01' (etc)
-    obs = pd.DataFrame(obsList, index=svList, columns=columnNames)
+    obs = pd.DataFrame(values, index=svList, columns=ToB)
+    obs['Epoch'] = recordEpochs
     obs.index.name = 'SV'
     obs['epoch'] = obs.Epoch 
     obs['Epoch'] = obs.Epoch
     obs.set_index('Epoch', append=True, inplace=True)
     obs = obs.reorder_levels(['Epoch', 'SV'])
-    obs["SYSTEM"] = _system_name(obs.index.get_level_values("SV"))
+    obs["SYSTEM"] = _system_column(obs.index.get_level_values("SV"))
     # =============================================================================
     fileEpoch = datetime.date(year = epoch.year,
                                 month = epoch.month,
@@ -684,6 +696,14 @@ def read_obsFile_v3(obsFileName,header):
     print("Observation file ", obsFileName," is read in", "{0:.2f}".format(finish-start), "seconds.")
     return Observation(f.name, fileEpoch, obs, approx_position, receiver_type, antenna_type, interval, receiver_clock, version, ToB)
 
+def _epochs_to_datetime(epochs):
+    # converts 'year month day hour minute second' strings to a DatetimeIndex, fractional seconds are truncated
+    # the same epoch is usually repeated for many satellites, so each distinct epoch is only converted once
+    codes, uniques = pd.factorize(np.array(epochs,dtype=object))
+    parts = np.array([x.split() for x in uniques],dtype=float).reshape(-1,6).astype(np.int64)
+    units = dict(zip(['year','month','day','hour','minute','second'],parts.T))
+    return pd.DatetimeIndex(pd.to_datetime(units))[codes]
+
 #-------------------------------------------------------------------------
 #-------------------------------------------------------------------------
 #------------------------------- SP3 FILE --------------------------------
@@ -711,17 +731,13 @@ def read_sp3File(sp3file):
     sp3 = [i.replace('P  ', 'PG0') for i in sp3]
     sp3 = [i.replace('P ', 'PG') for i in sp3]
     header = ['X', 'Y', 'Z', 'deltaT', 'sigmaX', 'sigmaY', 'sigmaZ', 'sigmadeltaT', 'Epoch']
-    sat, pos = [], []
+    sat, pos, epochs, iepoch = [], [], [], []
     while True:
         for i in range(int(SVNo)+1):
             if '*' in sp3[i]:
                 sp3[i] = sp3[i].split()
-                epoch=datetime.datetime(year = int(sp3[i][1]),
-                                        month = int(sp3[i][2]),
-                                        day = int(sp3[i][3]),
-                                        hour = int(sp3[i][4]),
-                                        minute =int(sp3[i][5]),
-                                        second = 0)
+                # epochs are converted all at once at the end, seconds are ignored
+                epochs.append(' '.join(sp3[i][1:6]+['0']))
             else:
                 if '999999.999999' in sp3[i]:
                     sp3[i] = sp3[i].replace(' 999999.999999', '          None')
@@ -742,12 +758,13 @@ def read_sp3File(sp3file):
                     sp3[i].extend(['None', 'None', 'None', 'None'])
                 sat.append(sp3[i][0][1:])
                 sp3[i] = [float(j) if isfloat(j) == True else None for j in sp3[i]]
-                sp3[i].append(epoch)
+                iepoch.append(len(epochs)-1)
                 pos.append(sp3[i][1:])
         del sp3[0:int(SVNo)+1]
         if 'EOF' in sp3[0]:
             break
-    position = pd.DataFrame(pos, index = sat, columns = header)
+    position = pd.DataFrame(pos, index = sat, columns = header[:-1])
+    position['Epoch'] = _epochs_to_datetime(epochs)[iepoch]
     position.index.name = 'SV'
     position.set_index('Epoch', append=True, inplace=True)
     position = position.reorder_levels(["Epoch","SV"])
@@ -802,21 +819,18 @@ def read_clockFile(clkFile):
                 del clk[0:line+1]
                 break
 
-    timelist = []
-    for i in range(len(clk)):
-        if clk[i][0:2]=='AS':
-            timelist.append(clk[i].split())
+    # the fields of each line are only kept as strings, epochs and clock values are converted all at once
     Sat = []
     Epochlist = []
     SVtime = []
-    for i in range(len(timelist)):
-        Sat.append(timelist[i][1])
-        Epochlist.append((datetime.datetime(year = int(timelist[i][2]), month = int(timelist[i][3]),
-                                        day = int(timelist[i][4]), hour = int(timelist[i][5]), 
-                                        minute = int(timelist[i][6]), second =int(float(timelist[i][7])))))
-        SVtime.append(float(timelist[i][9]))
-    SVTimelist = pd.DataFrame(list(zip(Epochlist, SVtime)), index = Sat,
-                columns=['Epoch','DeltaTSV'])
+    for clkLine in clk:
+        if clkLine[0:2]=='AS':
+            clkLine = clkLine.split()
+            Sat.append(clkLine[1])
+            Epochlist.append(' '.join(clkLine[2:8]))
+            SVtime.append(clkLine[9])
+    SVTimelist = pd.DataFrame({'Epoch':_epochs_to_datetime(Epochlist), 'DeltaTSV':np.array(SVtime,dtype=float)},
+                              index = Sat)
     f.close() # close the file
     end = time.time()
     print('{}'.format(clkFile), 'file is read in', '{0:.2f}'.format(end-start), 'seconds')
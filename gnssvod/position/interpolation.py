@@ -1,12 +1,17 @@
 # ===========================================================
 # ========================= imports =========================
+import os
 import time
+import pickle
+import hashlib
 import pandas as _pd
 import numpy as _np
 import pdb
 import datetime as _dt
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from gnssvod.io import readFile
+from gnssvod.funcs.checkif import isexist
 from gnssvod.geodesy.coordinate import cart2ell, geocentric_latitude
 from gnssvod.funcs.funcs import (sp3FileName, clockFileName, ionFileName, coord_interp)
 from gnssvod.position.position import _observation_picker_by_band
@@ -14,7 +19,8 @@ from gnssvod.position.position import _observation_picker_by_band
 
 __all__ = ["sp3_interp", "ionosphere_interp"]
 
-def sp3_interp_fast(start_time, end_time, interval=30, poly_degree=16, sp3_product="gfz", clock_product="gfz"):
+def sp3_interp_fast(start_time, end_time, interval=30, poly_degree=16, sp3_product="gfz", clock_product="gfz", cachedir=None):
+    # if cachedir is given, the parsed SP3 and clock files are cached there (see _read_cached)
     # add a buffer around start and end time
     start_time_withbuff = start_time-_dt.timedelta(hours=2.1)
     end_time_withbuff = end_time+_dt.timedelta(hours=2.1)
@@ -25,9 +31,16 @@ def sp3_interp_fast(start_time, end_time, interval=30, poly_degree=16, sp3_produ
     sp3FileNames = [sp3FileName(x.date(),sp3_product) for x in epochs]
     clockFileNames = [clockFileName(x.date(),interval,clock_product) for x in epochs]
     #--------------------------------------------------------------------------
-    # reading all those files, downloading them if necessary
-    sp3 = [readFile.read_sp3File(x) for x in sp3FileNames]
-    clock = [readFile.read_clockFile(x) for x in clockFileNames]
+    # missing files are first downloaded and extracted one at a time, since this happens in the current directory
+    for x in sp3FileNames+clockFileNames:
+        if (cachedir is None) or (not os.path.exists(_cache_name(x,cachedir))):
+            isexist(x)
+    # the files are then read in a small pool of threads
+    with ThreadPoolExecutor(max_workers=min(4,len(sp3FileNames)+len(clockFileNames))) as executor:
+        sp3 = executor.map(lambda x: _read_cached(readFile.read_sp3File,x,cachedir),sp3FileNames)
+        clock = executor.map(lambda x: _read_cached(readFile.read_clockFile,x,cachedir),clockFileNames)
+        sp3 = list(sp3)
+        clock = list(clock)
     #--------------------------------------------------------------------------
     # concatenate data from current day and some buffer before and after
     start = time.time()
@@ -145,6 +158,45 @@ def sp3_interp_fast(start_time, end_time, interval=30, poly_degree=16, sp3_produ
     print("SP3 interpolation is done in", '{0:.2f}'.format(finish-start), 'seconds')
     return sp3matched
 
+def _read_cached(reader,filename,cachedir=None):
+    # reads an orbit or clock file with reader, going through an on-disk cache of the parsed data if cachedir is given
+    # (caching is off by default, cached files are never deleted and can be removed by deleting cachedir)
+    # a cache entry is used if the file has the same content (size and sha1 hash) as when it was cached, or if the file
+    # is not present anymore (product file names are unique, so it is then not downloaded and parsed again)
+    if cachedir is None:
+        return reader(filename)
+    cachefile = _cache_name(filename,cachedir)
+    stamp = _file_stamp(filename)
+    if os.path.exists(cachefile):
+        with open(cachefile,'rb') as f:
+            cached_stamp, data = pickle.load(f)
+        if (stamp is None) or (stamp==cached_stamp):
+            return data
+    data = reader(filename)
+    stamp = _file_stamp(filename)
+    if stamp is not None:
+        os.makedirs(cachedir,exist_ok=True)
+        # write to a temporary file first so that an interrupted write never leaves a corrupted cache
+        tmpfile = f"{cachefile}.{os.getpid()}.tmp"
+        with open(tmpfile,'wb') as f:
+            pickle.dump((stamp,data),f,protocol=5)
+        os.replace(tmpfile,cachefile)
+    return data
+
+def _cache_name(filename,cachedir):
+    # name of the cache entry of an orbit or clock file
+    return os.path.join(cachedir,f"{os.path.basename(filename)}.pkl")
+
+def _file_stamp(filename):
+    # size and sha1 hash of the content of a file, or None if the file does not exist
+    if not os.path.exists(filename):
+        return None
+    digest = hashlib.sha1()
+    with open(filename,'rb') as f:
+        for block in iter(lambda: f.read(2**20),b''):
+            digest.update(block)
+    return (os.path.getsize(filename),digest.hexdigest())
+
 def sp3_interp(epoch, interval=30, poly_degree=16, sp3_product="gfz", clock_product="gfz"):
     epoch_yesterday = epoch - timedelta(days=1)
     epoch_tomorrow =  epoch + timedelta(days=1)
@@ -28,7 +28,8 @@ setup(
     "pyunpack",
     "hatanaka",
     "tqdm",
-    "xarray"
+    "xarray",
+    "h5netcdf"
   ],
   include_package_data = True,
   package_data = {"gnssvod.doc": ["IGSList.txt"]},